@@ -1,6 +1,19 @@
 import argparse
-import csv
-from typing import List, Tuple
+import itertools
+import math
+import operator
+import os
+import queue
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# NumPy is optional; the NumPy scan is only planned when it is installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 ##############################################################################
@@ -9,7 +22,38 @@ from typing import List, Tuple
 
 class Cookie_Finder:
 
-    def __init__(self, filename: str, date: str) -> None:
+    # Relative cost (in arbitrary units) of reading one row into a string, and of
+    # splitting + parsing one row with find_cookie_name_and_epoch. Used by the query planner.
+    ROW_READ_COST = 1.0
+    ROW_PARSE_COST = 6.0
+
+    # Relative cost of checking the order of one row's timestamp text, which binary search does before searching
+    ROW_ORDER_CHECK_COST = 1.5
+
+    # Relative cost of scanning one row with NumPy, and the fixed cost of setting up a NumPy scan
+    NUMPY_ROW_COST = 0.45
+    NUMPY_SCAN_OVERHEAD = 1000.0
+
+    # Default number of bytes per block and number of blocks in flight for the read-ahead pipeline
+    READ_AHEAD_BLOCK_SIZE = 1 << 20
+    READ_AHEAD_QUEUE_DEPTH = 4
+
+    # Length of a timestamp in the YYYY-MM-DDTHH:MM:SS+HH:MM format, and the [first, last) columns of its
+    # year, month, day, hour, minute, second, offset hour, and offset minute fields
+    TIMESTAMP_LENGTH = 25
+    TIMESTAMP_FIELDS = [(0, 4), (5, 7), (8, 10), (11, 13), (14, 16), (17, 19), (20, 22), (23, 25)]
+
+    # Number of rows sampled (at evenly spaced byte offsets) when planning a query
+    PLAN_SAMPLE_SIZE = 32
+
+    SECONDS_PER_DAY = 86400
+
+    # Caches shared by all objects for the timestamp engine; (Key: 'YYYY-MM-DD' or '+HH:MM', Value: seconds)
+    _date_cache = {}
+    _offset_cache = {}
+
+    def __init__(self, filename: str, date: str, timezone: str = 'UTC',
+                 block_size: int = READ_AHEAD_BLOCK_SIZE, queue_depth: int = READ_AHEAD_QUEUE_DEPTH) -> None:
         """
             The constructor of the "Most Active" Cookie Finder, which contains the necessary attributes for each object.
             Note: the name is Cookie Finder instead of "Most_Active_Cookie_Finder" (or anything of the sort), just in case we 
@@ -17,14 +61,25 @@ class Cookie_Finder:
 
             Params: filename (a valid CSV filename that this object will be associated with).
                     date     (a valid date that we will consider to find the most active cookie).
+                    timezone (the reporting timezone that the date is in; 'UTC', a '+HH:MM' offset, or an IANA name).
+                    block_size  (the number of bytes read per block by the read-ahead pipeline).
+                    queue_depth (the number of reusable blocks in the read-ahead pipeline).
             Returns: Nothing, but creates a Cookie_Finder object that is designated to the given cookie logs.
         """
 
         self.filename = filename            # Store the filename for future uses
         self.date = date                    # Date of interest
+        self.timezone = Cookie_Finder.parse_timezone(timezone)     # Reporting timezone (offset in seconds or ZoneInfo)
+        self.day_start, self.day_end = Cookie_Finder.day_window(date, self.timezone)    # Epoch seconds [start, end) of the date
         self.freq_map = {}                  # Frequency of each cookie given the date of interest; (Key: cookie name, Value: frequency of cookie)
         self.max_freq = 0                   # Frequency of the most occurring cookie in a given date
 
+        if block_size < 1 or queue_depth < 1:
+            raise ValueError("Invalid read-ahead settings. Requires a positive block size and queue depth.")
+
+        self.block_size = block_size        # Bytes per block read by the read-ahead pipeline
+        self.queue_depth = queue_depth      # Number of reusable blocks in the read-ahead pipeline
+
 
     ##############################################################################
     ###################           Validation Checks           ####################
@@ -77,16 +132,325 @@ class Cookie_Finder:
             raise ValueError("Invalid Day Provided.")
 
 
+    ##############################################################################
+    ###################            Timestamp Engine            ###################
+    ##############################################################################
+
+    '''
+        Timestamps are in the ISO-8601 form YYYY-MM-DDTHH:MM:SS+HH:MM, and producers may emit any offset.
+        Instead of comparing the raw date text (which ignores the offset) or parsing every row with datetime (which is slow),
+        we turn each timestamp into epoch seconds with fixed-position integer parsing.
+        The date of interest is turned into an epoch window [day_start, day_end) once, so each row only needs a comparison.
+    '''
+
+
+    @staticmethod
+    def parse_timezone(timezone: str) -> Union[int, ZoneInfo]:
+        """
+            Converts the given reporting timezone into something the timestamp engine can use.
+
+            Params: timezone (a string such as 'UTC', '+05:30', '-08:00', or an IANA name such as 'America/Los_Angeles').
+            Returns: the offset from UTC in seconds for fixed offsets, or a ZoneInfo object for IANA names.
+        """
+
+        if timezone in ('UTC', 'Z'):
+            return 0
+
+        if len(timezone) == 6 and timezone[0] in '+-' and timezone[3] == ':':
+            return Cookie_Finder.offset_to_seconds(timezone)
+
+        try:
+            return ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError("Invalid timezone. Requires UTC, +HH:MM, or an IANA timezone name.")
+
+
+    @staticmethod
+    def offset_to_seconds(offset: str) -> int:
+        """
+            Converts a UTC offset into seconds.
+
+            Params: offset (a string in the form of +HH:MM, -HH:MM, or Z).
+            Returns: the offset from UTC in seconds.
+        """
+
+        if offset == 'Z':
+            return 0
+
+        if len(offset) != 6 or offset[0] not in '+-' or offset[3] != ':':
+            raise ValueError("Invalid offset format. Requires +HH:MM format.")
+
+        hours, minutes = int(offset[1:3]), int(offset[4:6])
+        if hours > 23 or minutes > 59:
+            raise ValueError("Invalid offset format. Requires +HH:MM format.")
+
+        seconds = hours * 3600 + minutes * 60
+        return -seconds if offset[0] == '-' else seconds
+
+
+    @staticmethod
+    def offset_spread(offsets) -> int:
+        """
+            Finds how far apart the given offsets are. A log sorted by its timestamp text is in epoch order up to this spread.
+
+            Params: offsets (a collection of offsets in the form of +HH:MM, -HH:MM, or Z).
+            Returns: the difference between the largest and smallest offset in seconds (0 if there are no offsets).
+        """
+
+        seconds = [Cookie_Finder.offset_to_seconds(offset) for offset in offsets]
+
+        return max(seconds) - min(seconds) if seconds else 0
+
+
+    @staticmethod
+    def days_from_civil(year: int, month: int, day: int) -> int:
+        """
+            Converts a date into the number of days since 1970-01-01 using integer arithmetic only.
+            Years are shifted so that they start in March, which puts the leap day at the end of the year.
+
+            Params: year, month, day (integers of a valid date).
+            Returns: the number of days since 1970-01-01 (negative for earlier dates).
+        """
+
+        year -= month <= 2
+        era = year // 400
+        year_of_era = year - era * 400
+        day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+        day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+
+        return era * 146097 + day_of_era - 719468
+
+
+    @staticmethod
+    def civil_from_days(days: int) -> str:
+        """
+            The inverse of days_from_civil.
+
+            Params: days (the number of days since 1970-01-01).
+            Returns: the date as a string in the YYYY-MM-DD format.
+        """
+
+        days += 719468
+        era = days // 146097
+        day_of_era = days - era * 146097
+        year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+        day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+        shifted_month = (5 * day_of_year + 2) // 153
+
+        day = day_of_year - (153 * shifted_month + 2) // 5 + 1
+        month = shifted_month + (3 if shifted_month < 10 else -9)
+        year = year_of_era + era * 400 + (month <= 2)
+
+        return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+    @staticmethod
+    def timestamp_to_epoch(timestamp: str) -> int:
+        """
+            Converts an ISO-8601 timestamp with an offset into epoch seconds using fixed-position integer parsing.
+            The date and offset parts repeat across many rows, so their conversions are cached.
+
+            Params: timestamp (a string in the form of YYYY-MM-DDTHH:MM:SS+HH:MM).
+            Returns: the number of seconds since 1970-01-01T00:00:00+00:00.
+
+            Runtime Complexity: O(1), as every field is at a fixed position.
+            Space Complexity: O(d + o) where d is the number of unique dates and o is the number of unique offsets seen so far.
+        """
+
+        date_part = timestamp[:10]
+        days = Cookie_Finder._date_cache.get(date_part)
+
+        if days is None:
+            Cookie_Finder.valid_date(date_part)
+            days = Cookie_Finder.days_from_civil(int(date_part[:4]), int(date_part[5:7]), int(date_part[8:10]))
+            Cookie_Finder._date_cache[date_part] = days
+
+        offset_part = timestamp[19:]
+        offset = Cookie_Finder._offset_cache.get(offset_part)
+
+        if offset is None:
+            offset = Cookie_Finder.offset_to_seconds(offset_part)
+            Cookie_Finder._offset_cache[offset_part] = offset
+
+        return (days * 86400 + int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+                - offset)
+
+
+    @staticmethod
+    def day_window(date: str, timezone: Union[int, ZoneInfo]) -> Tuple[int, int]:
+        """
+            Converts a date in the reporting timezone into the epoch seconds that the date covers.
+
+            Params: date     (a valid date in the YYYY-MM-DD format).
+                    timezone (the offset in seconds or a ZoneInfo object returned by parse_timezone).
+            Returns: the first epoch second of the date, and the first epoch second of the following date.
+        """
+
+        year, month, day = int(date[:4]), int(date[5:7]), int(date[8:10])
+
+        if isinstance(timezone, int):
+            day_start = Cookie_Finder.days_from_civil(year, month, day) * Cookie_Finder.SECONDS_PER_DAY - timezone
+            return day_start, day_start + Cookie_Finder.SECONDS_PER_DAY
+
+        # Days in IANA timezones are not always 24 hours long (e.g. daylight saving time)
+        start = datetime(year, month, day, tzinfo=timezone)
+        end = datetime.combine(start.date() + timedelta(days=1), start.timetz())
+
+        return int(start.timestamp()), int(end.timestamp())
+
+
+    def epoch_to_date(self, epoch: int) -> str:
+        """
+            Converts epoch seconds into the date that it falls on in the reporting timezone.
+
+            Params: epoch (the number of seconds since 1970-01-01T00:00:00+00:00).
+            Returns: the date as a string in the YYYY-MM-DD format.
+        """
+
+        if isinstance(self.timezone, int):
+            return Cookie_Finder.civil_from_days((epoch + self.timezone) // Cookie_Finder.SECONDS_PER_DAY)
+
+        return datetime.fromtimestamp(epoch, dt_timezone.utc).astimezone(self.timezone).date().isoformat()
+
+
+    ##############################################################################
+    ##################          Read-Ahead I/O Pipeline          ##################
+    ##############################################################################
+
+    '''
+        Reading a block and parsing it one after the other leaves either the disk or the CPU idle at any point in time.
+        Instead, a background thread prefetches the next blocks of the file into a small ring of reusable buffers
+        while the counting loop parses the current one. Reads are block_size bytes each (starting at offset 0),
+        so they stay aligned whenever block_size is a multiple of the page size (such as the default of 1 MiB).
+    '''
+
+
+    def read_ahead_blocks(self):
+        """
+            Reads the cookie log with a background thread that prefetches up to queue_depth blocks ahead of the caller.
+            Partial rows at the end of a block are carried over, so every yielded block holds complete rows only.
+            The header (i.e. "cookie,timestamp") is skipped.
+
+            Params: None
+            Returns: a generator of memoryviews (or bytes) of complete rows. A yielded memoryview points into a reusable buffer,
+                     so it is only valid until the next block is requested.
+
+            Runtime Complexity: O(s) where s is the size of the file in bytes.
+            Space Complexity: O(bq) where b is the block size and q is the queue depth.
+        """
+
+        free_buffers = queue.Queue()            # Buffers that the reader can fill
+        filled_buffers = queue.Queue()          # (buffer, number of bytes read) pairs waiting to be parsed
+        stop = threading.Event()
+        reader = None
+
+        def prefetch(csvfile) -> None:
+            try:
+                while True:
+                    buffer = free_buffers.get()
+                    if stop.is_set():
+                        break
+
+                    size = csvfile.readinto(buffer)
+                    filled_buffers.put((buffer, size))
+
+                    # End of file
+                    if not size:
+                        break
+
+            except Exception as error:
+                # Hand the error over to the caller
+                filled_buffers.put((error, 0))
+
+            finally:
+                # Always end with an empty block, so the caller never waits forever
+                filled_buffers.put((None, 0))
+
+        with open(self.filename, 'rb', buffering=0) as csvfile:
+            try:
+                # Small files do not need full-sized blocks (or more than one block per read)
+                file_size = os.fstat(csvfile.fileno()).st_size
+                block_size = max(1, min(self.block_size, file_size))
+
+                for _ in range(min(self.queue_depth, -(-file_size // block_size) + 1)):
+                    free_buffers.put(bytearray(block_size))
+
+                reader = threading.Thread(target=prefetch, args=(csvfile,), daemon=True)
+                reader.start()
+
+                remainder = b''             # Partial row carried over from the previous block
+                skip_header = True
+
+                while True:
+                    buffer, size = filled_buffers.get()
+
+                    if isinstance(buffer, Exception):
+                        raise buffer
+                    if not size:
+                        break
+
+                    block = memoryview(buffer)[:size]
+                    end = buffer.rfind(b'\n', 0, size) + 1
+
+                    # The block does not even finish the current row
+                    if end == 0:
+                        remainder += block
+                        free_buffers.put(buffer)
+                        continue
+
+                    # The carried over row is completed by the first row of the block
+                    start = buffer.find(b'\n', 0, end) + 1
+                    first_row = remainder + block[:start]
+
+                    if skip_header:
+                        skip_header = False
+                    else:
+                        yield first_row
+
+                    if start < end:
+                        yield block[start:end]
+
+                    remainder = bytes(block[end:])
+                    free_buffers.put(buffer)
+
+                # The last row may not end with a newline
+                if remainder and not skip_header:
+                    yield remainder
+
+            finally:
+                # Wake the reader up in case it is waiting for a free buffer (the file is closed after it is done)
+                if reader is not None:
+                    stop.set()
+                    free_buffers.put(None)
+                    reader.join()
+
+
+    def read_ahead_lines(self):
+        """
+            Splits the blocks of read_ahead_blocks into batches of lines for the counting loops.
+
+            Params: None
+            Returns: a generator of lists of lines, without the line endings, the surrounding quotes, or empty lines.
+
+            Runtime Complexity: O(s) where s is the size of the file in bytes.
+            Space Complexity: O(bq) where b is the block size and q is the queue depth.
+        """
+
+        for block in self.read_ahead_blocks():
+            yield [line.strip('"') for line in str(block, 'utf-8').splitlines() if line]
+
+
     ##############################################################################
     ############              Find Most Frequent Cookie              ############# 
     ##############################################################################
 
-    def frequency_update(self, cookie_name: str):
+    def frequency_update(self, cookie_name: str, count: int = 1):
         """
             This function updates the hashmap containing the frequency of cookie names in the given date.
             It also updates the maximum frequency if we reached a new maximum.
 
             Params:  cookie_name (the name of the cookie of interest).
+                     count       (the number of occurrences of the cookie to add; 1 by default).
             Returns: Nothing, but updates the frequency hashmap and maximum frequency of cookies up to this point.
 
             Runtime Complexity: O(1) since we are simply utilizing hashing functions.
@@ -94,35 +458,46 @@ class Cookie_Finder:
         """
 
         # Only consider cookie names that occur in our date of interest
-        self.freq_map[cookie_name] = 1 + self.freq_map.get(cookie_name, 0)
+        self.freq_map[cookie_name] = count + self.freq_map.get(cookie_name, 0)
 
         if self.freq_map[cookie_name] > self.max_freq:
             # Update the maximum frequency of all cookies
             self.max_freq = self.freq_map[cookie_name]
 
 
-    def find_cookie_name_and_date(self, line: str) -> Tuple[str, str]:
+    def find_cookie_name_and_epoch(self, line: str) -> Tuple[str, int]:
         """
             Helper function to all functions defined below.
-            For a given line of the cookies log, this function returns the cookie name and date
-            by splitting the line contents into segments of interest.
+            For a given line of the cookies log, this function returns the cookie name and the timestamp
+            (in epoch seconds) by splitting the line contents at the ','.
             
             Params: line (a line of a cookies log (csv file)).
-            Returns: the cookie name and date of the given line (in the form of strings).
+            Returns: the cookie name (as a string) and timestamp (as epoch seconds) of the given line.
 
             Runtime Complexity: O(m) where m is the number of characters in the given line.
             Space Complexity: O(1), assuming that the given line does not play a role.
         """
 
-        separated_contents = line.split(',')
-        cookie_name = separated_contents[0]         # Cookie name is separated by a ','
+        cookie_name, _, timestamp = line.partition(',')
 
-        more_separated_contents = separated_contents[1].split('T')
-        cookie_date = more_separated_contents[0]    # Cookie date is separated by ',' and 'T'
+        return cookie_name, Cookie_Finder.timestamp_to_epoch(timestamp)
 
-        Cookie_Finder.valid_date(cookie_date)
 
-        return cookie_name, cookie_date
+    def find_cookie_name_and_date(self, line: str) -> Tuple[str, str]:
+        """
+            For a given line of the cookies log, this function returns the cookie name and the date
+            that the timestamp falls on in the reporting timezone (taking the offset of the timestamp into account).
+            
+            Params: line (a line of a cookies log (csv file)).
+            Returns: the cookie name and date of the given line (in the form of strings).
+
+            Runtime Complexity: O(m) where m is the number of characters in the given line.
+            Space Complexity: O(1), assuming that the given line does not play a role.
+        """
+
+        cookie_name, cookie_epoch = self.find_cookie_name_and_epoch(line)
+
+        return cookie_name, self.epoch_to_date(cookie_epoch)
 
 
     def full_traversal_search(self) -> None:
@@ -145,18 +520,13 @@ class Cookie_Finder:
         self.freq_map = {}
         self.max_freq = 0
 
-        with open(self.filename, 'r') as csvfile:
-            csv_reader = csv.reader(csvfile)
-            next(csv_reader)        # Skip the header (i.e. "cookie,timestamp")
-
-            for line in csv_reader:
-                # line is in the form of [line contents: string]
-                line = line[0]
-                
-                cookie_name, cookie_date = self.find_cookie_name_and_date(line)
+        # The read-ahead pipeline skips the header (i.e. "cookie,timestamp") and hands over batches of lines
+        for lines in self.read_ahead_lines():
+            for line in lines:
+                cookie_name, cookie_epoch = self.find_cookie_name_and_epoch(line)
 
                 # Only obtain frequency of cookie if we have found our date of interest
-                if cookie_date == self.date:
+                if self.day_start <= cookie_epoch < self.day_end:
                     self.frequency_update(cookie_name)
         
         # No cookie found with the given date
@@ -174,16 +544,23 @@ class Cookie_Finder:
     ##########      Find Most Frequent Cookie Using Binary Search      ########### 
     ##############################################################################
 
-    def binary_search(self, csv_data: List[str], left: int, right: int) -> Tuple[int, int]:
+    def binary_search(self, csv_data: List[str], left: int, right: int, margin: int = 0) -> Tuple[int, int]:
         """
             This is a helper function to most_active_cookie_binary_search().
-            We perform binary search on the rows of the cookies data to find the FIRST
-            row with the given date.
+            We perform binary search on the rows of the cookies data (sorted by timestamp, newest first)
+            to find a row whose timestamp falls within the given date.
+
+            Logs sorted by the timestamp text (like the ones from cookie_log_generator.py) are only in epoch order
+            up to the spread of their offsets. Given that spread as the margin, a row that is more than the margin
+            after (or before) the date still rules out the rows before (or after) it, and the search stops at the
+            first row within the margin of the date instead.
 
             Params: csv_data (a list of strings containing the cookies log data).
                     left     (the left pointer).
                     right    (the right pointer).
-            Returns: the left and right pointers, starting at the index that contains the date of interest.
+                    margin   (how many seconds the rows can be out of epoch order; 0 by default).
+            Returns: the left and right pointers, starting at the index that contains the date of interest
+                     (or a row within the margin of it).
 
             Runtime Complexity: O(m * logn) where m is the number of chars in each line and n is the number of rows in csv_data.
             Space Complexity: O(1), assuming that the parameters do not contribute to the total space complexity.
@@ -193,14 +570,14 @@ class Cookie_Finder:
             # mid = (r + l) // 2 --> can lead to integer overflow
             mid = left + (right - left) // 2
 
-            # Find the cookie date of the current row of interest
-            _, cookie_date = self.find_cookie_name_and_date(csv_data[mid])
+            # Find the cookie timestamp of the current row of interest
+            _, cookie_epoch = self.find_cookie_name_and_epoch(csv_data[mid])
 
-            # Perform binary search to find the first date that is the same as the input date
-            if self.date < cookie_date:
+            # Perform binary search to find the first timestamp that falls within the input date (and margin)
+            if cookie_epoch >= self.day_end + margin:
                 left = mid + 1
             
-            elif self.date > cookie_date:
+            elif cookie_epoch < self.day_start - margin:
                 right = mid - 1
             
             else:
@@ -220,7 +597,7 @@ class Cookie_Finder:
             This function is the overarching function that finds the most active cookie(s) using binary search.
             It serves as an alternative/better solution to the most_active_cookie function, which searches through all the rows
             of the given cookie log per function call.
-            This function also depends on helper functions such as binary_search, find_cookie_name_and_date, and frequency_update.
+            This function also depends on helper functions such as binary_search, find_cookie_name_and_epoch, and frequency_update.
             
             Params: None
             Returns: None, but prints out the most active cookie(s) in the given log.
@@ -238,46 +615,484 @@ class Cookie_Finder:
         self.freq_map = {}
         self.max_freq = 0
 
-        with open(self.filename, 'r') as csvfile:
-            csv_reader = csv.reader(csvfile)
-            next(csv_reader)
+        # Store each line of the cookies log into a list for easier access to cookies content
+        csv_data = []
+        for lines in self.read_ahead_lines():
+            csv_data.extend(lines)
 
-            # Store each line of the cookies log into a list for easier access to cookies content
-            csv_data = [line[0] for line in csv_reader]
-            left, right = self.binary_search(csv_data, 0, len(csv_data) - 1)
+        # Binary search is only correct on a sorted log (newest first), so check the order of the timestamp text first.
+        # This is much cheaper than parsing every row, and sampling rows (like plan_query) can miss rows out of order.
+        timestamps = [line.partition(',')[2] for line in csv_data]
+        margin = None
 
-            # At least one cookie exists with the given input date
-            if left != -1:
-                # Check left
-                while left >= 0:
-                    # Obtain the cookie name and date of current row
-                    cookie_name, cookie_date = self.find_cookie_name_and_date(csv_data[left])
+        if all(map(operator.ge, timestamps, itertools.islice(timestamps, 1, None))):
+            # Rows with different offsets can be out of epoch order by up to the spread of the offsets
+            margin = Cookie_Finder.offset_spread({timestamp[19:] for timestamp in timestamps})
 
-                    if cookie_date == self.date:
-                        self.frequency_update(cookie_name)
-                        left -= 1
-                    else:
-                        break
+        else:
+            # Logs sorted by instant with mixed offsets are out of text order, so check the order of the epoch seconds next
+            epochs = [Cookie_Finder.timestamp_to_epoch(timestamp) for timestamp in timestamps]
 
-                # Check right
-                while right < len(csv_data):
-                    # Obtain the cookie name and date of current row
-                    cookie_name, cookie_date = self.find_cookie_name_and_date(csv_data[right])
+            if all(map(operator.ge, epochs, itertools.islice(epochs, 1, None))):
+                margin = 0
 
-                    if cookie_date == self.date:
-                        self.frequency_update(cookie_name)
-                        right += 1
-                    else:
-                        break
-                
-                # Print out all the cookie names with the highest frequency
-                for k, v in self.freq_map.items():
-                    if v == self.max_freq:
-                        print(k)
+        if margin is None:
+            # Fall back to counting every row (like full_traversal_search), reusing the parsed epoch seconds
+            for line, cookie_epoch in zip(csv_data, epochs):
+                if self.day_start <= cookie_epoch < self.day_end:
+                    self.frequency_update(line.partition(',')[0])
+
+            left = right = -1
+
+        else:
+            left, right = self.binary_search(csv_data, 0, len(csv_data) - 1, margin)
+
+        # At least one cookie exists within the margin of the given input date
+        if left != -1:
+            # Check left, until the rows are more than the margin after the date
+            while left >= 0:
+                # Obtain the cookie name and timestamp of current row
+                cookie_name, cookie_epoch = self.find_cookie_name_and_epoch(csv_data[left])
+
+                if cookie_epoch >= self.day_end + margin:
+                    break
+
+                if self.day_start <= cookie_epoch < self.day_end:
+                    self.frequency_update(cookie_name)
+                left -= 1
+
+            # Check right, until the rows are more than the margin before the date
+            while right < len(csv_data):
+                # Obtain the cookie name and timestamp of current row
+                cookie_name, cookie_epoch = self.find_cookie_name_and_epoch(csv_data[right])
+
+                if cookie_epoch < self.day_start - margin:
+                    break
+
+                if self.day_start <= cookie_epoch < self.day_end:
+                    self.frequency_update(cookie_name)
+                right += 1
             
-            # No cookie found with the given input date
-            else:
-                print("No cookie(s) found.")
+        # No cookie found with the given input date
+        if len(self.freq_map.items()) == 0:
+            print("No cookie(s) found.")
+
+        else:
+            # Print out all the cookie names with the highest frequency
+            for k, v in self.freq_map.items():
+                if v == self.max_freq:
+                    print(k)
+
+        
+    ##############################################################################
+    ##########        Find Most Frequent Cookie Using NumPy Scan       ###########
+    ##############################################################################
+
+    '''
+        Every row of a cookie log usually has the same width: a 16 character cookie name, a ',', a 25 character timestamp,
+        and a line ending (possibly with the row wrapped in quotes). Such a block of rows can be viewed as a 2-D array of bytes,
+        with one row per record and one column per character, and scanned with vectorized operations instead of row by row.
+    '''
+
+
+    @staticmethod
+    def record_tail(layout: Tuple[int, int, int]) -> Optional[bytes]:
+        """
+            Finds the characters that follow the timestamp in each record of the given layout.
+
+            Params: layout (the width of each record, the column of the first character of the cookie name, and the column of the ',').
+            Returns: the closing quote (if the rows are quoted) followed by the line ending, or None if the layout
+                     has no room for a YYYY-MM-DDTHH:MM:SS+HH:MM timestamp followed by a line ending.
+        """
+
+        width, name_start, comma = layout
+        tail_length = width - (comma + 1 + Cookie_Finder.TIMESTAMP_LENGTH)
+
+        # Only '\n' and '\r\n' line endings are expected
+        if tail_length not in (name_start + 1, name_start + 2):
+            return None
+
+        return b'"' * name_start + b'\r' * (tail_length - name_start - 1) + b'\n'
+
+
+    @staticmethod
+    def record_layout(row: bytes) -> Optional[Tuple[int, int, int]]:
+        """
+            Finds the fixed-width record layout of a cookie log from one of its rows.
+
+            Params: row (a raw row of the cookies log, including its line ending).
+            Returns: the width of each record, the column of the first character of the cookie name, and the column of the ',',
+                     or None if the row does not fit a fixed-width layout (e.g. a 'Z' offset or a missing ',').
+        """
+
+        name_start = 1 if row.startswith(b'"') else 0
+        comma = row.find(b',')
+
+        if comma == -1:
+            return None
+
+        layout = (len(row), name_start, comma)
+        tail = Cookie_Finder.record_tail(layout)
+
+        # The timestamp has to end right before the closing quote (if any) and the line ending
+        if tail is None or not row.endswith(tail):
+            return None
+
+        return layout
+
+
+    @staticmethod
+    def epochs_from_records(records, timestamp_start: int):
+        """
+            The vectorized version of timestamp_to_epoch, applied to the timestamp columns of a 2-D array of records.
+            All digit fields are combined into integers with a single matrix product of the timestamp columns
+            and a matrix of place values (float32 is exact for these values and is much faster than integer products).
+
+            Params: records         (a 2-D NumPy array of bytes, where each row is a record of the cookies log).
+                    timestamp_start (the column of the first character of the timestamp).
+            Returns: a NumPy array of epoch seconds (one per record), or None if any record does not hold a
+                     valid YYYY-MM-DDTHH:MM:SS+HH:MM timestamp at the expected columns.
+        """
+
+        timestamps = records[:, timestamp_start:timestamp_start + Cookie_Finder.TIMESTAMP_LENGTH]
+        fields = Cookie_Finder.TIMESTAMP_FIELDS
+        digit_cols = [col for first, last in fields for col in range(first, last)]
+
+        # Every separator has to be in place, and every other character has to be a digit
+        if not (timestamps[:, [4, 7, 10, 13, 16, 22]] == np.frombuffer(b'--T:::', dtype=np.uint8)).all():
+            return None
+
+        signs = timestamps[:, 19]
+        if not ((signs == ord('+')) | (signs == ord('-'))).all():
+            return None
+
+        # Characters below '0' wrap around to large values, as the bytes are unsigned
+        if not ((timestamps[:, digit_cols] - np.uint8(ord('0'))) <= 9).all():
+            return None
+
+        # Combine the fields into (year * 12 + month, month, day, seconds of the day, seconds of the offset);
+        # each entry is (timestamp field, combined field, multiplier)
+        combinations = [(0, 0, 12), (1, 0, 1), (1, 1, 1), (2, 2, 1), (3, 3, 3600), (4, 3, 60), (5, 3, 1), (6, 4, 3600), (7, 4, 60)]
+
+        # Place value of each digit column in each combined field; (Rows: timestamp columns, Columns: combined fields)
+        place_values = np.zeros((Cookie_Finder.TIMESTAMP_LENGTH, 5), dtype=np.float32)
+        for field, combined, multiplier in combinations:
+            first, last = fields[field]
+            for col in range(first, last):
+                place_values[col, combined] += multiplier * 10 ** (last - 1 - col)
+
+        # The digits are ASCII characters, so every combined field is off by ord('0') times the sum of its place values
+        combined = timestamps.astype(np.float32) @ place_values
+        combined = combined.astype(np.int64) - ord('0') * place_values.sum(axis=0).astype(np.int64)
+        months, month, day, seconds, offset = combined.T
+
+        if month.min() < 1 or month.max() > 12 or day.min() < 1 or day.max() > 31:
+            return None
+
+        # Dates repeat across many rows, so look up the first day of each month (since 1970-01-01) in a small table
+        first_month, last_month = int(months.min()), int(months.max())
+        month_starts = np.array([Cookie_Finder.days_from_civil(index // 12 - (index % 12 == 0), (index - 1) % 12 + 1, 1)
+                                 for index in range(first_month, last_month + 1)], dtype=np.int64)
+        days = month_starts[months - first_month] + day - 1
+
+        offset = np.where(signs == ord('-'), -offset, offset)
+
+        return days * Cookie_Finder.SECONDS_PER_DAY + seconds - offset
+
+
+    def scan_records(self, block: bytes, layout: Tuple[int, int, int]) -> bool:
+        """
+            Counts the cookies of the date of interest in a block of fixed-width records with vectorized operations.
+            The cookie names of the date of interest are counted with np.unique on fixed-width byte strings.
+
+            Params: block  (raw bytes (or a memoryview) of complete rows of the cookies log).
+                    layout (the record layout returned by record_layout).
+            Returns: True if the block was scanned, or False if the block does not match the layout
+                     (in which case nothing is counted).
+
+            Runtime Complexity: O(n * m) where n is the number of records and m is the width of each record,
+                                but with a small constant since the work is vectorized.
+            Space Complexity: O(n * m), for the timestamp columns and the matching cookie names.
+        """
+
+        width, name_start, comma = layout
+        tail = Cookie_Finder.record_tail(layout)
+
+        if tail is None or len(block) % width != 0:
+            return False
+
+        records = np.frombuffer(block, dtype=np.uint8).reshape(-1, width)
+
+        # Check that the block really consists of fixed-width records
+        if not (records[:, width - len(tail):] == np.frombuffer(tail, dtype=np.uint8)).all():
+            return False
+        if not (records[:, comma] == ord(',')).all():
+            return False
+        if name_start and not (records[:, 0] == ord('"')).all():
+            return False
+
+        epochs = Cookie_Finder.epochs_from_records(records, comma + 1)
+        if epochs is None:
+            return False
+
+        matches = (epochs >= self.day_start) & (epochs < self.day_end)
+        if matches.any():
+            names = np.ascontiguousarray(records[matches, name_start:comma]).view(f'S{comma - name_start}').ravel()
+            unique_names, counts = np.unique(names, return_counts=True)
+
+            for cookie_name, count in zip(unique_names, counts):
+                self.frequency_update(cookie_name.decode(), int(count))
+
+        return True
+
+
+    def scan_rows(self, block: bytes) -> None:
+        """
+            The row parser fallback of scan_records, for blocks that do not match the fixed-width record layout.
+
+            Params: block (raw bytes (or a memoryview) of complete rows of the cookies log).
+            Returns: Nothing, but updates the frequency hashmap with the cookies of the date of interest.
+        """
+
+        for line in str(block, 'utf-8').splitlines():
+            # Remove the surrounding quotes of each row (if any)
+            line = line.strip('"')
+
+            if line:
+                cookie_name, cookie_epoch = self.find_cookie_name_and_epoch(line)
+
+                if self.day_start <= cookie_epoch < self.day_end:
+                    self.frequency_update(cookie_name)
+
+
+    def numpy_scan_search(self) -> None:
+        """
+            This function prints out the cookie that occurs the most within the given input date,
+            by scanning large blocks of the raw cookie log with NumPy (see scan_records).
+            Unlike the binary search method, it does not require the log to be sorted.
+
+            Params: None
+            Returns: Nothing. Instead, this function prints out the names of cookies that occur most often.
+
+            Runtime Complexity: O(nm) where n is the number of rows in the cookies log and m is the number of chars in each row.
+            Space Complexity: O(bq + n) where b is the block size, q is the queue depth, and n is the number of rows.
+                              This is because each row can contain a unique cookie with the given input date.
+        """
+
+        if np is None:
+            raise ImportError("The NumPy scan requires NumPy to be installed.")
+
+        # Before anything, make sure the given file is a CSV file
+        Cookie_Finder.valid_csv(self.filename)
+
+        # Reset the member variables 
+        self.freq_map = {}
+        self.max_freq = 0
+
+        # The record layout is taken from the first non-empty row after the header (i.e. "cookie,timestamp")
+        with open(self.filename, 'rb') as csvfile:
+            csvfile.readline()
+            first_row = csvfile.readline()
+
+            while first_row and not first_row.strip():
+                first_row = csvfile.readline()
+
+        layout = Cookie_Finder.record_layout(first_row) if first_row.endswith(b'\n') else None
+
+        # The read-ahead pipeline hands over blocks of complete rows
+        for block in self.read_ahead_blocks():
+            if not layout or not self.scan_records(block, layout):
+                self.scan_rows(block)
+
+        # No cookie found with the given date
+        if len(self.freq_map.items()) == 0:
+            print("No cookie(s) found.")
+
+        else:
+            # Print out all the cookie names with the maximum frequency
+            for k, v in self.freq_map.items():
+                if v == self.max_freq:
+                    print(k)
+
+
+    ##############################################################################
+    ##################              Query Planner              ###################
+    ##############################################################################
+
+    def sample_rows(self, num_samples: int) -> Tuple[int, int, List[str]]:
+        """
+            Reads a handful of rows at evenly spaced byte offsets of the cookie log, without reading the whole file.
+            Each sample seeks to an offset, discards the (possibly partial) line it lands in, and keeps the next two.
+            Keeping neighbouring rows lets the planner see rows out of text order in logs sorted by instant with mixed offsets,
+            which far-apart rows alone would hide. The first and last data rows are always part of the sample.
+
+            Params: num_samples (the number of rows we would like to sample).
+            Returns: the file size (in bytes), the header size (in bytes), and the raw sampled rows (in bytes) in file order.
+
+            Runtime Complexity: O(k * m) where k is the number of samples and m is the number of chars in each row.
+            Space Complexity: O(k), since we only hold the sampled rows.
+        """
+
+        file_size = os.path.getsize(self.filename)
+        samples = []
+
+        with open(self.filename, 'rb') as csvfile:
+            header_size = len(csvfile.readline())
+            data_size = file_size - header_size
+
+            # First (non-empty) data row
+            first_row = csvfile.readline()
+            while first_row and not first_row.strip():
+                first_row = csvfile.readline()
+
+            if not first_row:
+                return file_size, header_size, samples
+            samples.append(first_row)
+            sampled_end = csvfile.tell()        # Rows before this point are already sampled (small files)
+
+            for i in range(1, num_samples - 1):
+                # Never go back to the rows already sampled; the last byte before sampled_end is a newline
+                csvfile.seek(max(header_size + data_size * i // (num_samples - 1), sampled_end - 1))
+                csvfile.readline()              # Skip the partial line we landed in
+
+                for _ in range(2):
+                    row = csvfile.readline()
+                    if row.strip():
+                        samples.append(row)
+                sampled_end = max(sampled_end, csvfile.tell())
+
+            # Last data row (the final line may or may not end with a newline)
+            if sampled_end < file_size:
+                csvfile.seek(max(sampled_end, file_size - 2 * len(first_row)))
+                tail = [row for row in csvfile.read().splitlines() if row.strip()]
+                if tail:
+                    samples.append(tail[-1])
+
+        return file_size, header_size, samples
+
+
+    def plan_query(self) -> Dict:
+        """
+            Samples cheap statistics of the cookie log and estimates the cost of each search strategy.
+            The strategy with the lowest estimated cost is chosen.
+
+            full_traversal reads every row and parses each one.
+            binary_search reads every row and checks their order, but only parses O(logn) rows plus the rows of the date of interest.
+            It needs the log to be sorted by timestamp text or by epoch seconds (newest first), so it is ruled out when the
+            sampled rows are in neither order. Logs that are only sorted by epoch seconds (mixed offsets) need every row
+            parsed for the order check, so binary_search is charged for parsing every row in that case.
+            Sampled rows in order do not prove that the whole log is sorted, so binary_search checks the order of every row
+            itself and falls back to counting every row when the log is not sorted.
+            numpy_scan scans every row with vectorized operations, so it only pays off past a fixed setup cost.
+            It is ruled out when NumPy is not installed.
+
+            Params: None
+            Returns: a dictionary with the chosen 'strategy', the cost 'estimates' of each strategy, and the sampled 'stats'.
+
+            Runtime Complexity: O(k * m) where k is the number of samples and m is the number of chars in each row.
+            Space Complexity: O(k), since we only hold the sampled rows.
+        """
+
+        file_size, header_size, samples = self.sample_rows(Cookie_Finder.PLAN_SAMPLE_SIZE)
+
+        # Estimate the number of rows from the average length of the sampled rows (except the last one,
+        # which may not end with a newline)
+        full_rows = samples[:-1] or samples
+        row_size = sum(len(row) for row in full_rows) / len(full_rows) if samples else 1
+        num_rows = round((file_size - header_size) / row_size)
+
+        # Strip the line ending and the surrounding quotes of each sampled row before parsing it
+        rows = [row.decode().strip().strip('"') for row in samples]
+        epochs = [self.find_cookie_name_and_epoch(row)[1] for row in rows]
+
+        # The log looks sorted if the timestamp text or the epoch seconds of all sampled rows are non-increasing
+        # (the same rule as binary_search)
+        timestamps = [row.partition(',')[2] for row in rows]
+        if all(timestamps[i] >= timestamps[i + 1] for i in range(len(timestamps) - 1)):
+            sort_order = 'text'
+        elif all(epochs[i] >= epochs[i + 1] for i in range(len(epochs) - 1)):
+            sort_order = 'epoch'
+        else:
+            sort_order = None
+        is_sorted = sort_order is not None
+
+        # Estimate the number of rows in the date of interest from the sampled fraction.
+        # If no sample hits the date, assume the rows are spread evenly over the days of the log.
+        matches = sum(self.day_start <= epoch < self.day_end for epoch in epochs)
+        if matches:
+            date_rows = num_rows * matches / len(epochs)
+        elif epochs and self.day_start <= max(epochs) and min(epochs) < self.day_end:
+            num_days = (max(epochs) - min(epochs)) / Cookie_Finder.SECONDS_PER_DAY + 1
+            date_rows = num_rows / num_days
+        else:
+            date_rows = 0
+
+        # Checking the order of a log only sorted by epoch seconds means parsing every row
+        order_check_cost = Cookie_Finder.ROW_ORDER_CHECK_COST if sort_order == 'text' else Cookie_Finder.ROW_PARSE_COST
+
+        estimates = {
+            'full_traversal': num_rows * (Cookie_Finder.ROW_READ_COST + Cookie_Finder.ROW_PARSE_COST),
+            'binary_search': (num_rows * (Cookie_Finder.ROW_READ_COST + order_check_cost)
+                              + (math.log2(num_rows + 1) + date_rows) * Cookie_Finder.ROW_PARSE_COST)
+                             if is_sorted else math.inf,
+            'numpy_scan': Cookie_Finder.NUMPY_SCAN_OVERHEAD + num_rows * Cookie_Finder.NUMPY_ROW_COST
+                          if np is not None else math.inf,
+        }
+
+        return {
+            'strategy': min(estimates, key=estimates.get),
+            'estimates': estimates,
+            'stats': {
+                'file_size': file_size,
+                'num_rows': num_rows,
+                'is_sorted': is_sorted,
+                'sort_order': sort_order,
+                'date_rows': round(date_rows),
+            },
+        }
+
+
+    def explain(self, plan: Dict) -> None:
+        """
+            Prints out the chosen plan of a query along with the sampled statistics and the cost estimates.
+
+            Params: plan (a dictionary returned by plan_query).
+            Returns: None, but prints out the plan.
+        """
+
+        stats = plan['stats']
+        sort_order = f" (by {stats['sort_order']})" if stats['is_sorted'] else ""
+
+        print(f"Plan: {plan['strategy']}")
+        print(f"  file size: {stats['file_size']} bytes, ~{stats['num_rows']} rows, "
+              f"sorted (sampled): {stats['is_sorted']}{sort_order}, ~{stats['date_rows']} rows on {self.date}")
+
+        for strategy, cost in plan['estimates'].items():
+            print(f"  {strategy}: estimated cost {cost:.1f}")
+        print()
+
+
+    def most_active_cookie(self, explain: bool = False) -> None:
+        """
+            Finds the most active cookie(s) with the cheapest strategy according to plan_query.
+
+            Params: explain (whether to print out the chosen plan before the result).
+            Returns: None, but prints out the most active cookie(s) in the given log.
+        """
+
+        # Before anything, make sure the given file is a CSV file
+        Cookie_Finder.valid_csv(self.filename)
+
+        plan = self.plan_query()
+        if explain:
+            self.explain(plan)
+
+        strategies = {
+            'full_traversal': self.full_traversal_search,
+            'binary_search': self.most_active_cookie_binary_search,
+            'numpy_scan': self.numpy_scan_search,
+        }
+        strategies[plan['strategy']]()
 
         
 ##############################################################################
@@ -293,6 +1108,13 @@ def main():
     parser = argparse.ArgumentParser(description="Find the most active cookie on a certain day.")
     parser.add_argument('filename', help='Path to the CSV file containing the cookie data.')
     parser.add_argument('-d', '--date', help="Date for the most active cookie (YYYY-MM-DD)", required=True)
+    parser.add_argument('-t', '--timezone', default='UTC',
+                        help="Reporting timezone of the date: UTC (default), +HH:MM, or an IANA name such as America/Los_Angeles")
+    parser.add_argument('--block-size', type=int, default=Cookie_Finder.READ_AHEAD_BLOCK_SIZE,
+                        help="Number of bytes per block read ahead of parsing (preferably a multiple of 4096)")
+    parser.add_argument('--queue-depth', type=int, default=Cookie_Finder.READ_AHEAD_QUEUE_DEPTH,
+                        help="Number of blocks that can be read ahead of parsing")
+    parser.add_argument('--explain', action='store_true', help="Print out the chosen search strategy and its cost estimates")
 
     args = parser.parse_args()
 
@@ -304,17 +1126,15 @@ def main():
     Cookie_Finder.valid_date(date)
 
     # Create a Cookie Finder object
-    cookie_finder = Cookie_Finder(filename, date)
+    cookie_finder = Cookie_Finder(filename, date, args.timezone, args.block_size, args.queue_depth)
 
-    # Two functions that find the most active cookie
-    # cookie_finder.full_traversal_search()                   # Full Traversal Method
-    # print()
-    cookie_finder.most_active_cookie_binary_search()        # Binary Search Method
+    # The query planner picks between the Full Traversal, Binary Search, and NumPy Scan methods
+    cookie_finder.most_active_cookie(explain=args.explain)
 
 
 if __name__ == '__main__':
     """
-        It's best to run one of these functions at a time.
+        The query planner decides which search method to run.
     """
     
     main()                                          # Run the functions to find most active cookie
@@ -1,8 +1,31 @@
 import unittest
+import unittest.mock
 import sys
+import os
+import io
+import contextlib
 import subprocess
+import random
+import tempfile
 from most_active_cookie import Cookie_Finder
 from most_active_cookie import main
+from most_active_cookie import np
+
+
+def run_search(cookie_finder, search):
+    """
+        Runs one of the search methods of the given Cookie Finder object and captures what it prints out.
+
+        Params: cookie_finder (a Cookie_Finder object).
+                search        (one of its search methods, such as Cookie_Finder.full_traversal_search).
+        Returns: the set of printed lines and a copy of the frequency hashmap after the search.
+    """
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        search(cookie_finder)
+
+    return set(output.getvalue().strip().split('\n')), dict(cookie_finder.freq_map)
 
 class TestMostActiveCookie(unittest.TestCase):
     """
@@ -285,6 +308,388 @@ class TestMostActiveCookie(unittest.TestCase):
         self.assertEqual(processed_result, "fBsaJfYNabwaiSSu\n")
 
 
+    def test_timestamp_to_epoch(self):
+        """
+            Tests whether timestamps with different offsets are converted into the correct epoch seconds.
+        """
+
+        self.assertEqual(Cookie_Finder.timestamp_to_epoch("1970-01-01T00:00:00+00:00"), 0)
+        self.assertEqual(Cookie_Finder.timestamp_to_epoch("2018-12-09T14:19:00+00:00"), 1544365140)
+
+        # The same instant with different offsets
+        self.assertEqual(Cookie_Finder.timestamp_to_epoch("2018-12-09T19:49:00+05:30"), 1544365140)
+        self.assertEqual(Cookie_Finder.timestamp_to_epoch("2018-12-09T06:19:00-08:00"), 1544365140)
+
+        # Leap day
+        self.assertEqual(Cookie_Finder.timestamp_to_epoch("2024-02-29T00:00:00+00:00"), 1709164800)
+        self.assertEqual(Cookie_Finder.civil_from_days(1709164800 // 86400), "2024-02-29")
+
+        # Invalid month and offset
+        with self.assertRaises(ValueError):
+            Cookie_Finder.timestamp_to_epoch("2018-13-09T14:19:00+00:00")
+        with self.assertRaises(ValueError):
+            Cookie_Finder.timestamp_to_epoch("2018-12-09T14:19:00+0000")
+
+
+    def test_offset_aware_day_bucketing(self):
+        """
+            Tests whether rows are bucketed by their UTC date (or the date in the reporting timezone),
+            instead of the raw date text before the 'T'.
+        """
+
+        # 2018-12-09T01:00:00+05:30 is still 2018-12-08 in UTC
+        cookie_finder = Cookie_Finder('cookie_log.csv', '2018-12-08')
+        _, cookie_date = cookie_finder.find_cookie_name_and_date("AtY0laUfhglK3lC7,2018-12-09T01:00:00+05:30")
+        self.assertEqual(cookie_date, "2018-12-08")
+
+        # But it is 2018-12-09 when reporting in India Standard Time
+        cookie_finder2 = Cookie_Finder('cookie_log.csv', '2018-12-09', '+05:30')
+        _, cookie_date = cookie_finder2.find_cookie_name_and_date("AtY0laUfhglK3lC7,2018-12-09T01:00:00+05:30")
+        self.assertEqual(cookie_date, "2018-12-09")
+
+        # IANA timezones, where 2018-03-11 is only 23 hours long due to daylight saving time
+        cookie_finder3 = Cookie_Finder('cookie_log.csv', '2018-03-11', 'America/Los_Angeles')
+        self.assertEqual(cookie_finder3.day_end - cookie_finder3.day_start, 23 * 3600)
+
+        with self.assertRaises(ValueError):
+            Cookie_Finder('cookie_log.csv', '2018-12-09', 'Not/A_Timezone')
+
+        # Rows are sorted by the instant they occurred, but their offsets differ
+        csv_data = [
+            "AtY0laUfhglK3lC7,2018-12-09T01:00:00-08:00",      # 2018-12-09T09:00:00+00:00
+            "SAZuXPGUrfbcn5UA,2018-12-09T10:13:00+05:30",      # 2018-12-09T04:43:00+00:00
+            "5UAVanZf6UtGyKVS,2018-12-09T02:00:00+05:30",      # 2018-12-08T20:30:00+00:00
+            "AtY0laUfhglK3lC7,2018-12-08T22:03:00+00:00",
+            "4sMM2LxV07bPJzwf,2018-12-07T23:30:00+00:00",
+        ]
+
+        cookie_finder4 = Cookie_Finder('cookie_log.csv', '2018-12-08')
+        left, right = cookie_finder4.binary_search(csv_data, 0, len(csv_data) - 1)
+        self.assertEqual(left, 2)
+        self.assertEqual(right, 3)
+
+
+    def test_read_ahead_lines(self):
+        """
+            Tests whether the read-ahead pipeline hands over every line of the cookie log exactly once
+            (without the header), regardless of the block size and queue depth.
+        """
+
+        with open('more_cookie_log.csv', 'r') as csvfile:
+            expected_lines = [line.strip().strip('"') for line in csvfile.readlines()[1:]]
+
+        for block_size, queue_depth in [(1, 1), (7, 2), (46, 3), (4096, 4), (1 << 20, 1)]:
+            cookie_finder = Cookie_Finder('more_cookie_log.csv', '2023-10-05', block_size=block_size, queue_depth=queue_depth)
+            lines = [line for batch in cookie_finder.read_ahead_lines() for line in batch]
+            self.assertEqual(lines, expected_lines)
+
+        # Stopping early should not leave the reader thread waiting for a free buffer
+        cookie_finder = Cookie_Finder('more_cookie_log.csv', '2023-10-05', block_size=64, queue_depth=2)
+        batches = cookie_finder.read_ahead_lines()
+        self.assertEqual(next(batches), expected_lines[:1])
+        batches.close()
+
+        # The last line does not need to end with a newline
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'cookie_log.csv')
+            with open(filename, 'w') as csvfile:
+                csvfile.write('"cookie,timestamp"\n"AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00"')
+
+            cookie_finder = Cookie_Finder(filename, '2018-12-09', block_size=10)
+            lines = [line for batch in cookie_finder.read_ahead_lines() for line in batch]
+            self.assertEqual(lines, ["AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00"])
+
+        # Errors of the reader thread (of any kind) are handed over instead of leaving the caller waiting
+        opened_files = []
+
+        class FailingFile:
+            def __init__(self, *args, **kwargs):
+                self.csvfile = open(*args, **kwargs)
+                opened_files.append(self.csvfile)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                self.csvfile.close()
+
+            def fileno(self):
+                return self.csvfile.fileno()
+
+            def readinto(self, buffer):
+                raise RuntimeError("Read failed.")
+
+        cookie_finder = Cookie_Finder('cookie_log.csv', '2018-12-09')
+        with unittest.mock.patch('most_active_cookie.open', FailingFile, create=True):
+            with self.assertRaises(RuntimeError):
+                list(cookie_finder.read_ahead_lines())
+
+            # Errors before the reader thread starts do not leak the file
+            with unittest.mock.patch('most_active_cookie.os.fstat', side_effect=OSError("Stat failed.")):
+                with self.assertRaises(OSError):
+                    list(cookie_finder.read_ahead_lines())
+
+        self.assertEqual(len(opened_files), 2)
+        self.assertTrue(all(csvfile.closed for csvfile in opened_files))
+
+        with self.assertRaises(ValueError):
+            Cookie_Finder('cookie_log.csv', '2018-12-09', block_size=0)
+        with self.assertRaises(ValueError):
+            Cookie_Finder('cookie_log.csv', '2018-12-09', queue_depth=0)
+
+        # Tunable from the command line
+        output = ['python', './most_active_cookie.py', 'cookie_log.csv', '-d', '2018-12-09', '--block-size', '16', '--queue-depth', '2']
+        processed_result = subprocess.check_output(output, text=True)
+        self.assertEqual(processed_result, "AtY0laUfhglK3lC7\n")
+
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_numpy_scan_search(self):
+        """
+            Tests the NUMPY SCAN method of finding the most active cookie, including blocks that
+            do not match the fixed-width record layout and have to fall back to the row parser.
+        """
+
+        # The NumPy scan has to agree with the full traversal method
+        for date in ['2018-12-09', '2018-12-08', '2023-01-01']:
+            cookie_finder = Cookie_Finder('cookie_log.csv', date)
+            self.assertEqual(run_search(cookie_finder, Cookie_Finder.numpy_scan_search),
+                             run_search(cookie_finder, Cookie_Finder.full_traversal_search))
+
+        for date in ['2023-10-05', '2023-12-26', '2023-01-01']:
+            cookie_finder = Cookie_Finder('more_cookie_log.csv', date, '-03:00')
+            self.assertEqual(run_search(cookie_finder, Cookie_Finder.numpy_scan_search),
+                             run_search(cookie_finder, Cookie_Finder.full_traversal_search))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'mixed_cookie_log.csv')
+            with open(filename, 'w') as csvfile:
+                csvfile.write('"cookie,timestamp"\n'
+                              '"AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00"\n'
+                              '"SAZuXPGUrfbcn5UA,2018-12-09T10:13:00+05:30"\n'
+                              '"shortCookie,2018-12-09T09:00:00+00:00"\n'         # Does not match the layout
+                              '"SAZuXPGUrfbcn5UA,2018-12-09T01:00:00-08:00"\n'
+                              '"AtY0laUfhglK3lC7,2018-12-08T22:03:00+00:00"')      # No newline at the end
+
+            # Small blocks so that some blocks are aligned and others fall back to the row parser
+            cookie_finder = Cookie_Finder(filename, '2018-12-09', block_size=90)
+            names, freq_map = run_search(cookie_finder, Cookie_Finder.numpy_scan_search)
+
+            self.assertEqual(names, {"SAZuXPGUrfbcn5UA"})
+            self.assertEqual(freq_map, {"AtY0laUfhglK3lC7": 1, "SAZuXPGUrfbcn5UA": 2, "shortCookie": 1})
+
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_numpy_scan_other_layouts(self):
+        """
+            Tests the NUMPY SCAN method on logs that do not match the usual fixed-width record layout
+            ('Z' offsets, shorter cookie names, and a blank first row). They have to be large enough
+            for the planner to pick the NumPy scan.
+        """
+
+        random_generator = random.Random(28)
+        names = ["AtY0laUfhglK3lC7", "SAZuXPGUrfbcn5UA", "5UAVanZf6UtGyKVS", "4sMM2LxV07bPJzwf"]
+        short_names = ["AtY0laUf", "SAZuXPGU", "5UAVanZf", "4sMM2LxV"]
+
+        logs = {
+            'z_offset': (names, 'Z', '"cookie,timestamp"\n'),
+            'short_name': (short_names, '+00:00', '"cookie,timestamp"\n'),
+            'blank_first_row': (names, '+00:00', '"cookie,timestamp"\n\n'),
+        }
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for log, (cookie_names, offset, header) in logs.items():
+                filename = os.path.join(tmpdir, log + '.csv')
+
+                # Rows in random order, so that binary search is ruled out
+                with open(filename, 'w') as csvfile:
+                    csvfile.write(header)
+                    for _ in range(5000):
+                        csvfile.write(f'"{random_generator.choice(cookie_names)},2018-12-0{random_generator.randint(1, 9)}'
+                                      f'T{random_generator.randint(0, 23):02d}:19:00{offset}"\n')
+
+                cookie_finder = Cookie_Finder(filename, '2018-12-05')
+                self.assertEqual(cookie_finder.plan_query()['strategy'], 'numpy_scan')
+                self.assertEqual(run_search(cookie_finder, Cookie_Finder.numpy_scan_search),
+                                 run_search(cookie_finder, Cookie_Finder.full_traversal_search))
+
+                output = ['python', './most_active_cookie.py', filename, '-d', '2018-12-05']
+                processed_result = subprocess.check_output(output, text=True)
+                self.assertEqual(set(processed_result.strip().split('\n')),
+                                 run_search(cookie_finder, Cookie_Finder.full_traversal_search)[0])
+
+        # Layouts without room for a full timestamp are rejected instead of being scanned
+        self.assertIsNone(Cookie_Finder.record_layout(b'"AtY0laUfhglK3lC7,2018-12-09T14:19:00Z"\r\n'))
+        self.assertIsNone(Cookie_Finder.record_layout(b'\n'))
+        self.assertEqual(Cookie_Finder.record_layout(b'"AtY0laUf,2018-12-09T14:19:00+00:00"\r\n'), (38, 1, 9))
+
+
+    def test_binary_search_text_ordered_offsets(self):
+        """
+            Tests the BINARY SEARCH method on a log with mixed offsets that is sorted by its timestamp text
+            (the way cookie_log_generator.py sorts it), which is not the same as being sorted by epoch seconds.
+        """
+
+        random_generator = random.Random(27)
+        names = [''.join(random_generator.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789") for _ in range(16))
+                 for _ in range(100)]
+
+        rows = []
+        for _ in range(1500):
+            rows.append(f"{random_generator.choice(names)},2023-{random_generator.randint(1, 12):02d}-{random_generator.randint(1, 28):02d}"
+                        f"T{random_generator.randint(0, 23):02d}:{random_generator.randint(0, 59):02d}:00"
+                        f"{random_generator.choice(['+00:00', '+05:30', '-08:00'])}")
+
+        # Sorted by timestamp text, newest first
+        rows.sort(key=lambda row: row.split(',')[1], reverse=True)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'text_ordered_cookie_log.csv')
+            with open(filename, 'w') as csvfile:
+                csvfile.write('"cookie,timestamp"\n')
+                for row in rows:
+                    csvfile.write(f'"{row}"\n')
+
+            for month in range(1, 13):
+                for day in (1, 10, 24, 28):
+                    cookie_finder = Cookie_Finder(filename, f"2023-{month:02d}-{day:02d}")
+                    self.assertEqual(run_search(cookie_finder, Cookie_Finder.most_active_cookie_binary_search),
+                                     run_search(cookie_finder, Cookie_Finder.full_traversal_search))
+
+            # Dates outside of the log
+            cookie_finder = Cookie_Finder(filename, "2022-12-30")
+            self.assertEqual(run_search(cookie_finder, Cookie_Finder.most_active_cookie_binary_search), ({"No cookie(s) found."}, {}))
+
+
+    def test_binary_search_instant_ordered_offsets(self):
+        """
+            Tests the BINARY SEARCH method on a log with mixed offsets that is sorted by instant (epoch seconds),
+            which is out of text order, and checks that it really searches instead of counting every row.
+        """
+
+        random_generator = random.Random(26)
+        names = [''.join(random_generator.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789") for _ in range(16))
+                 for _ in range(100)]
+
+        rows = []
+        for _ in range(1500):
+            rows.append(f"{random_generator.choice(names)},2023-{random_generator.randint(1, 12):02d}-{random_generator.randint(1, 28):02d}"
+                        f"T{random_generator.randint(0, 23):02d}:{random_generator.randint(0, 59):02d}:00"
+                        f"{random_generator.choice(['+00:00', '+05:30', '-08:00'])}")
+
+        # Sorted by instant, newest first
+        rows.sort(key=lambda row: Cookie_Finder.timestamp_to_epoch(row.split(',')[1]), reverse=True)
+        timestamps = [row.split(',')[1] for row in rows]
+        self.assertNotEqual(timestamps, sorted(timestamps, reverse=True))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'instant_ordered_cookie_log.csv')
+            with open(filename, 'w') as csvfile:
+                csvfile.write('"cookie,timestamp"\n')
+                for row in rows:
+                    csvfile.write(f'"{row}"\n')
+
+            for month in range(1, 13):
+                for day in (1, 10, 24, 28):
+                    cookie_finder = Cookie_Finder(filename, f"2023-{month:02d}-{day:02d}")
+                    with unittest.mock.patch.object(Cookie_Finder, 'binary_search', autospec=True,
+                                                    side_effect=Cookie_Finder.binary_search) as binary_search:
+                        result = run_search(cookie_finder, Cookie_Finder.most_active_cookie_binary_search)
+                    binary_search.assert_called()
+                    self.assertEqual(result, run_search(cookie_finder, Cookie_Finder.full_traversal_search))
+
+
+    def test_plan_query(self):
+        """
+            Tests whether the query planner picks the binary search method for sorted logs,
+            and falls back to the full traversal method for unsorted logs.
+        """
+
+        # Sorted log (newest first); the NumPy scan is even cheaper when NumPy is installed
+        cookie_finder = Cookie_Finder('more_cookie_log.csv', '2023-10-05')
+        plan = cookie_finder.plan_query()
+        self.assertEqual(plan['strategy'], 'binary_search' if np is None else 'numpy_scan')
+        self.assertTrue(plan['stats']['is_sorted'])
+        self.assertLess(plan['estimates']['binary_search'], plan['estimates']['full_traversal'])
+
+        # Unsorted log, where binary search would give the wrong answer
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'unsorted_cookie_log.csv')
+            with open(filename, 'w') as csvfile:
+                # Rows are quoted, just like the logs written by cookie_log_generator.py
+                csvfile.write('"cookie,timestamp"\n'
+                              '"SAZuXPGUrfbcn5UA,2018-12-08T22:03:00+00:00"\n'
+                              '"AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00"\n'
+                              '"4sMM2LxV07bPJzwf,2018-12-07T23:30:00+00:00"\n'
+                              '"AtY0laUfhglK3lC7,2018-12-09T06:19:00+00:00"\n')
+
+            cookie_finder2 = Cookie_Finder(filename, '2018-12-09')
+            plan = cookie_finder2.plan_query()
+            self.assertEqual(plan['strategy'], 'full_traversal')
+            self.assertFalse(plan['stats']['is_sorted'])
+
+            output = ['python', './most_active_cookie.py', filename, '-d', '2018-12-09']
+            processed_result = subprocess.check_output(output, text=True)
+            self.assertEqual(processed_result, "AtY0laUfhglK3lC7\n")
+
+            # Log sorted by instant with mixed offsets, which is out of text order but still sorted by epoch seconds
+            filename = os.path.join(tmpdir, 'instant_cookie_log.csv')
+            with open(filename, 'w') as csvfile:
+                csvfile.write('cookie,timestamp\n'
+                              'SAZuXPGUrfbcn5UA,2018-12-09T12:00:00+05:30\n'
+                              'AtY0laUfhglK3lC7,2018-12-08T22:00:00-08:00\n'
+                              '4sMM2LxV07bPJzwf,2018-12-09T04:00:00+00:00\n'
+                              'AtY0laUfhglK3lC7,2018-12-08T18:00:00-08:00\n')
+
+            plan = Cookie_Finder(filename, '2018-12-09').plan_query()
+            self.assertTrue(plan['stats']['is_sorted'])
+            self.assertEqual(plan['stats']['sort_order'], 'epoch')
+
+
+    def test_binary_search_unsorted_between_samples(self):
+        """
+            Tests whether the BINARY SEARCH method falls back to counting every row when the log is out of order
+            between the rows sampled by the planner, instead of silently giving the wrong answer.
+        """
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'almost_sorted_cookie_log.csv')
+
+            # Sorted log (newest first), except for two rows of 2023-06-15 that were appended among the rows of 2023-01-01
+            with open('more_cookie_log.csv', 'r') as csvfile:
+                lines = csvfile.readlines()
+            lines.insert(len(lines) - 3, '"outOfOrder000001,2023-06-15T12:00:00+00:00"\n')
+            lines.insert(len(lines) - 3, '"outOfOrder000001,2023-06-15T13:00:00+00:00"\n')
+
+            with open(filename, 'w') as csvfile:
+                csvfile.writelines(lines)
+
+            cookie_finder = Cookie_Finder(filename, '2023-06-15')
+            plan = cookie_finder.plan_query()
+            self.assertTrue(plan['stats']['is_sorted'])         # The sample misses the rows out of order
+
+            names, freq_map = run_search(cookie_finder, Cookie_Finder.most_active_cookie_binary_search)
+            self.assertEqual((names, freq_map), run_search(cookie_finder, Cookie_Finder.full_traversal_search))
+            self.assertEqual(freq_map['outOfOrder000001'], 2)
+
+
+    def test_explain(self):
+        """
+            Tests whether the --explain flag prints out the chosen plan before the most active cookie.
+        """
+
+        output = ['python', './most_active_cookie.py', 'cookie_log.csv', '-d', '2018-12-09', '--explain']
+        processed_result = subprocess.check_output(output, text=True)
+        lines = processed_result.strip().split('\n')
+
+        plan = Cookie_Finder('cookie_log.csv', '2018-12-09').plan_query()
+        self.assertEqual(lines[0], "Plan: " + plan['strategy'])
+        self.assertIn("sorted (sampled): True", processed_result)
+        self.assertIn("full_traversal", processed_result)
+        self.assertIn("binary_search", processed_result)
+        self.assertEqual(lines[-1], "AtY0laUfhglK3lC7")
+
+
 if __name__ == '__main__':
     unittest.main()
 